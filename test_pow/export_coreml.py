@@ -137,6 +137,13 @@ def main():
         outputs=[ct.TensorType(name="output")]
     )
     
+    # The ternary weights hold at most 3 distinct values, so "unique" palettization
+    # stores them losslessly as 2-bit indices into a LUT instead of FP16.
+    palettize_config = ct.optimize.coreml.OptimizationConfig(
+        global_config=ct.optimize.coreml.OpPalettizerConfig(mode="unique")
+    )
+    mlmodel = ct.optimize.coreml.palettize_weights(mlmodel, palettize_config)
+    
     # Save the Core ML model.
     mlmodel.save("test_coreml.mlpackage")
     print("Model saved as 'test_coreml.mlpackage'.")
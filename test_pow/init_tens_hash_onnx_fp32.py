@@ -26,8 +26,9 @@ def generate_matrices(seed, num_rounds):
     zero_message = bytes(total_size)
     keystream = crypto_stream_chacha20_xor(zero_message, nonce, seed)
     
-    # Match C version's uint8_t data type
-    data = np.frombuffer(keystream, dtype=np.uint8).astype(np.float32)
+    # Match C version's uint8_t data type; matrices stay uint8 views of the keystream
+    # and are only cast to FP32 one at a time when written as initializers
+    data = np.frombuffer(keystream, dtype=np.uint8)
     
     print("Using seed:", seed.hex())
     
@@ -74,23 +75,46 @@ def generate_matrices(seed, num_rounds):
     
     return expand_matrix, middle_matrices, reduce_matrix
 
-def main(seed_hex, num_rounds):
-    try:
-        seed = parse_seed(seed_hex)
-    except ValueError as e:
-        sys.exit("Error: " + str(e))
-    
-    expand_matrix, middle_matrices, reduce_matrix = generate_matrices(seed, num_rounds)
-    
-    print("\nMatrix shapes:")
-    print(f"  expand_matrix: {expand_matrix.shape}")
-    print(f"  middle_matrices[0]: {middle_matrices[0].shape}")
-    print(f"  reduce_matrix: {reduce_matrix.shape}")
-    
-    # Define graph inputs - using FP32 directly
-    input_tensor = helper.make_tensor_value_info("input", onnx.TensorProto.FLOAT, [1, INPUT_SIZE])
-    error_tensor = helper.make_tensor_value_info("error", onnx.TensorProto.FLOAT, [1, INPUT_SIZE])
+def fold_matrices(expand_matrix, middle_matrices, reduce_matrix):
+    """
+    Collapse all rounds into one affine map mod 256.
+
+    Every round is h = (M h + tile(error)) mod 256 and reducing mod 256 commutes with
+    the matmuls, so the whole network equals (A input + B error) mod 256 with
+    A, B of shape [OUTPUT_SIZE, INPUT_SIZE]. Returns W = [A | B], shape [32, 64].
+    """
+    E = expand_matrix.astype(np.int64)
+    T = np.tile(np.eye(INPUT_SIZE, dtype=np.int64), (HIDDEN_SIZE // INPUT_SIZE, 1))  # tile(error) = T error
+    # Track h = P input + Q error (mod 256)
+    P = E % 256
+    Q = T
+    for m in middle_matrices:
+        m = m.astype(np.int64)
+        P = (m @ P) % 256
+        Q = (m @ Q + T) % 256
+    R = reduce_matrix.astype(np.int64)
+    A = (R @ P) % 256
+    B = (R @ Q + np.eye(OUTPUT_SIZE, INPUT_SIZE, dtype=np.int64)) % 256
+    return np.concatenate([A, B], axis=1).astype(np.float32)
+
+def build_folded_nodes(expand_matrix, middle_matrices, reduce_matrix):
+    """Single Concat -> Gemm -> Mod graph for a fixed number of rounds (see fold_matrices)."""
+    folded = fold_matrices(expand_matrix, middle_matrices, reduce_matrix)
+    print(f"\nFolded {len(middle_matrices)} rounds into a single {folded.shape} matrix")
     
+    initializers = [
+        helper.make_tensor("const_256", onnx.TensorProto.FLOAT, [], [256.0]),
+        helper.make_tensor("folded_weights", onnx.TensorProto.FLOAT, folded.shape, folded.tobytes(), raw=True),
+    ]
+    # Largest accumulator is 64 * 255 * 255 < 2^24, so FP32 stays exact
+    nodes = [
+        helper.make_node("Concat", ["input", "error"], ["input_error"], axis=1),
+        helper.make_node("Gemm", ["input_error", "folded_weights"], ["folded_gemm"], transB=1),
+        helper.make_node("Mod", ["folded_gemm", "const_256"], ["output"], fmod=1),
+    ]
+    return nodes, initializers
+
+def build_round_nodes(expand_matrix, middle_matrices, reduce_matrix, num_rounds):
     initializers = []
     nodes = []
 
@@ -103,7 +127,8 @@ def main(seed_hex, num_rounds):
         "expand_weights", 
         onnx.TensorProto.FLOAT,
         expand_matrix.shape,
-        expand_matrix.flatten().tolist()
+        expand_matrix.astype(np.float32).tobytes(),
+        raw=True
     )
     initializers.append(expand_weight_tensor)
     
@@ -111,8 +136,8 @@ def main(seed_hex, num_rounds):
     repeats = helper.make_tensor(
         "repeats",
         onnx.TensorProto.INT64,
-        [2],  # Shape is [2] for repeating [1, 32] input
-        [1, 8]  # Repeat first dim 1x, second dim 8x to get [1, 256]
+        [2],  # Shape is [2] for repeating [batch, 32] input
+        [1, 8]  # Repeat first dim 1x, second dim 8x to get [batch, 256]
     )
     initializers.append(repeats)
     
@@ -148,7 +173,8 @@ def main(seed_hex, num_rounds):
             weight_name,
             onnx.TensorProto.FLOAT,
             m.shape,
-            m.flatten().tolist()
+            m.astype(np.float32).tobytes(),
+            raw=True
         )
         initializers.append(weight_tensor)
         
@@ -173,7 +199,8 @@ def main(seed_hex, num_rounds):
         "reduce_weights",
         onnx.TensorProto.FLOAT,
         reduce_matrix.shape,
-        reduce_matrix.flatten().tolist()
+        reduce_matrix.astype(np.float32).tobytes(),
+        raw=True
     )
     initializers.append(reduce_weight_tensor)
     
@@ -192,8 +219,32 @@ def main(seed_hex, num_rounds):
     
     nodes.extend([final_gemm, final_mod])
     
+    return nodes, initializers
+
+def main(seed_hex, num_rounds, fold=False):
+    try:
+        seed = parse_seed(seed_hex)
+    except ValueError as e:
+        sys.exit("Error: " + str(e))
+    
+    expand_matrix, middle_matrices, reduce_matrix = generate_matrices(seed, num_rounds)
+    
+    print("\nMatrix shapes:")
+    print(f"  expand_matrix: {expand_matrix.shape}")
+    print(f"  middle_matrices[0]: {middle_matrices[0].shape}")
+    print(f"  reduce_matrix: {reduce_matrix.shape}")
+    
+    # Define graph inputs - using FP32 directly, with a dynamic batch dimension
+    input_tensor = helper.make_tensor_value_info("input", onnx.TensorProto.FLOAT, ["batch", INPUT_SIZE])
+    error_tensor = helper.make_tensor_value_info("error", onnx.TensorProto.FLOAT, ["batch", INPUT_SIZE])
+    
+    if fold:
+        nodes, initializers = build_folded_nodes(expand_matrix, middle_matrices, reduce_matrix)
+    else:
+        nodes, initializers = build_round_nodes(expand_matrix, middle_matrices, reduce_matrix, num_rounds)
+    
     # Define output tensor
-    output_tensor = helper.make_tensor_value_info("output", onnx.TensorProto.FLOAT, [1, OUTPUT_SIZE])
+    output_tensor = helper.make_tensor_value_info("output", onnx.TensorProto.FLOAT, ["batch", OUTPUT_SIZE])
     
     # Create graph
     graph = helper.make_graph(
@@ -215,7 +266,7 @@ def main(seed_hex, num_rounds):
     print("\nModel Structure:")
     print("Inputs:")
     for input in model.graph.input:
-        print(f"  {input.name}: {[d.dim_value for d in input.type.tensor_type.shape.dim]}")
+        print(f"  {input.name}: {[d.dim_param or d.dim_value for d in input.type.tensor_type.shape.dim]}")
     
     print("\nNodes:")
     for i, node in enumerate(model.graph.node):
@@ -225,14 +276,14 @@ def main(seed_hex, num_rounds):
     
     print("\nOutputs:")
     for output in model.graph.output:
-        print(f"  {output.name}: {[d.dim_value for d in output.type.tensor_type.shape.dim]}")
+        print(f"  {output.name}: {[d.dim_param or d.dim_value for d in output.type.tensor_type.shape.dim]}")
     
     onnx.save(model, "tens_hash_fp32.onnx")
     print("\nOptimized ONNX model saved as tens_hash_fp32.onnx")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        sys.exit("Usage: {} <seed_hex> <num_rounds>".format(sys.argv[0]))
+    if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] != "--fold"):
+        sys.exit("Usage: {} <seed_hex> <num_rounds> [--fold]".format(sys.argv[0]))
     
     seed_hex = sys.argv[1].strip()
     try:
@@ -243,6 +294,6 @@ if __name__ == "__main__":
         sys.exit("Error: num_rounds must be a positive integer")
 
     try:
-        main(seed_hex, num_rounds)
+        main(seed_hex, num_rounds, fold=len(sys.argv) == 4)
     except Exception as e:
         sys.exit("Error: " + str(e))
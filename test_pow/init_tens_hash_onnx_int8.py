@@ -2,9 +2,10 @@
 """
 This script creates an ONNX model that uses only uint8 matrix multiplications
 (using MatMulInteger). The model uses uint8 inputs and weights, produces int32
-results from MatMulInteger, then applies an explicit modulo 256 reduction and
-casts the result back to uint8. This ensures that arithmetic is done in a wrap‑around
-(mod 256) fashion and that the weight values match the FP32 model.
+results from MatMulInteger and casts the result back to uint8. The accumulator is
+never negative, so the truncating int32 -> uint8 Cast keeps exactly the low byte,
+i.e. arithmetic is done in a wrap‑around (mod 256) fashion without a Mod node, and
+the weight values match the FP32 model.
 """
 
 import sys
@@ -111,48 +112,42 @@ def main(seed_hex, num_rounds):
     print(f"  middle_matrices[0]: {middle_matrices[0].shape}")  # Expected: (256,256)
     print(f"  reduce_weight: {reduce_weight.shape}")        # Expected: (256,32)
     
-    # --- Define graph inputs (all uint8) ---
-    input_tensor = helper.make_tensor_value_info("input", onnx.TensorProto.UINT8, [1, INPUT_SIZE])
-    error_tensor = helper.make_tensor_value_info("error", onnx.TensorProto.UINT8, [1, INPUT_SIZE])
+    # --- Define graph inputs (all uint8, dynamic batch dimension) ---
+    input_tensor = helper.make_tensor_value_info("input", onnx.TensorProto.UINT8, ["batch", INPUT_SIZE])
+    error_tensor = helper.make_tensor_value_info("error", onnx.TensorProto.UINT8, ["batch", INPUT_SIZE])
     
     initializers = []
     nodes = []
     
-    # Constant for modulo operation (256 as int32)
-    const_256 = helper.make_tensor("const_256", onnx.TensorProto.INT32, [], [256])
-    initializers.append(const_256)
-    
     # Zero point constant for MatMulInteger (scalar uint8 0)
     zp = helper.make_tensor("zp", onnx.TensorProto.UINT8, [], [0])
     initializers.append(zp)
     
     # --- Tiling error ---
     # For the expansion and middle layers, we need the "error" input repeated to match HIDDEN_SIZE.
-    repeats = helper.make_tensor("repeats", onnx.TensorProto.INT64, [2], [1, 8])  # Tile [1,32] -> [1,256]
+    repeats = helper.make_tensor("repeats", onnx.TensorProto.INT64, [2], [1, 8])  # Tile [batch,32] -> [batch,256]
     initializers.append(repeats)
     tile_error = helper.make_node("Tile", ["error", "repeats"], ["error_256"])
     nodes.append(tile_error)
     
+    # The bias is shared by the expansion and middle layers, so cast it to int32 once.
+    cast_error_256 = helper.make_node("Cast", ["error_256"], ["error_256_int32"], to=onnx.TensorProto.INT32, name="cast_error_256")
+    nodes.append(cast_error_256)
+    
     # --- Expansion Layer ---
-    # MatMulInteger: [1, INPUT_SIZE] x [INPUT_SIZE, HIDDEN_SIZE] -> [1, HIDDEN_SIZE]
+    # MatMulInteger: [batch, INPUT_SIZE] x [INPUT_SIZE, HIDDEN_SIZE] -> [batch, HIDDEN_SIZE]
     # Here, expand_weight has shape (32,256), which yields the desired result.
-    expand_weight_tensor = helper.make_tensor("expand_weights", onnx.TensorProto.UINT8, expand_weight.shape, expand_weight.flatten().tolist())
+    expand_weight_tensor = helper.make_tensor("expand_weights", onnx.TensorProto.UINT8, expand_weight.shape, expand_weight.tobytes(), raw=True)
     initializers.append(expand_weight_tensor)
     matmul_exp = helper.make_node("MatMulInteger", ["input", "expand_weights", "zp", "zp"], ["expand_mm"], name="matmul_exp")
     nodes.append(matmul_exp)
     
-    # Add bias: error_256 (uint8) is cast to int32 before addition.
-    cast_error_exp = helper.make_node("Cast", ["error_256"], ["error_256_int32"], to=onnx.TensorProto.INT32, name="cast_error_exp")
-    nodes.append(cast_error_exp)
+    # Add bias in int32.
     add_exp = helper.make_node("Add", ["expand_mm", "error_256_int32"], ["expand_add_int32"], name="add_exp")
     nodes.append(add_exp)
     
-    # Apply modulo 256 on the int32 result.
-    mod_exp = helper.make_node("Mod", ["expand_add_int32", "const_256"], ["expand_mod_int32"], name="mod_exp")
-    nodes.append(mod_exp)
-    
-    # Cast result back to uint8.
-    cast_exp = helper.make_node("Cast", ["expand_mod_int32"], ["expand_final"], to=onnx.TensorProto.UINT8, name="cast_exp")
+    # Cast result back to uint8 (truncation == modulo 256).
+    cast_exp = helper.make_node("Cast", ["expand_add_int32"], ["expand_final"], to=onnx.TensorProto.UINT8, name="cast_exp")
     nodes.append(cast_exp)
     
     prev_output = "expand_final"
@@ -161,27 +156,23 @@ def main(seed_hex, num_rounds):
     for i in range(num_rounds):
         weight_name = f"weights_{i}"
         m = middle_matrices[i]  # effective weight already computed (shape (256,256))
-        weight_tensor = helper.make_tensor(weight_name, onnx.TensorProto.UINT8, m.shape, m.flatten().tolist())
+        weight_tensor = helper.make_tensor(weight_name, onnx.TensorProto.UINT8, m.shape, m.tobytes(), raw=True)
         initializers.append(weight_tensor)
         
         matmul_mid = helper.make_node("MatMulInteger", [prev_output, weight_name, "zp", "zp"], [f"gemm_{i}_mm"], name=f"matmul_mid_{i}")
         nodes.append(matmul_mid)
         
-        cast_error_mid = helper.make_node("Cast", ["error_256"], [f"error_256_int32_{i}"], to=onnx.TensorProto.INT32, name=f"cast_error_mid_{i}")
-        nodes.append(cast_error_mid)
-        add_mid = helper.make_node("Add", [f"gemm_{i}_mm", f"error_256_int32_{i}"], [f"gemm_{i}_add_int32"], name=f"add_mid_{i}")
+        add_mid = helper.make_node("Add", [f"gemm_{i}_mm", "error_256_int32"], [f"gemm_{i}_add_int32"], name=f"add_mid_{i}")
         nodes.append(add_mid)
-        mod_mid = helper.make_node("Mod", [f"gemm_{i}_add_int32", "const_256"], [f"hidden_{i}_int32"], name=f"mod_mid_{i}")
-        nodes.append(mod_mid)
-        cast_mid = helper.make_node("Cast", [f"hidden_{i}_int32"], [f"hidden_{i}"], to=onnx.TensorProto.UINT8, name=f"cast_mid_{i}")
+        cast_mid = helper.make_node("Cast", [f"gemm_{i}_add_int32"], [f"hidden_{i}"], to=onnx.TensorProto.UINT8, name=f"cast_mid_{i}")
         nodes.append(cast_mid)
         
         prev_output = f"hidden_{i}"
     
     # --- Final Reduction Layer ---
     # reduce_weight has shape (256,32) so that:
-    # [1, HIDDEN_SIZE] x [HIDDEN_SIZE, OUTPUT_SIZE] = [1, OUTPUT_SIZE].
-    reduce_weight_tensor = helper.make_tensor("reduce_weights", onnx.TensorProto.UINT8, reduce_weight.shape, reduce_weight.flatten().tolist())
+    # [batch, HIDDEN_SIZE] x [HIDDEN_SIZE, OUTPUT_SIZE] = [batch, OUTPUT_SIZE].
+    reduce_weight_tensor = helper.make_tensor("reduce_weights", onnx.TensorProto.UINT8, reduce_weight.shape, reduce_weight.tobytes(), raw=True)
     initializers.append(reduce_weight_tensor)
     matmul_fin = helper.make_node("MatMulInteger", [prev_output, "reduce_weights", "zp", "zp"], ["final_mm"], name="matmul_fin")
     nodes.append(matmul_fin)
@@ -190,13 +181,11 @@ def main(seed_hex, num_rounds):
     nodes.append(cast_error_fin)
     add_fin = helper.make_node("Add", ["final_mm", "error_int32"], ["final_add_int32"], name="add_fin")
     nodes.append(add_fin)
-    mod_fin = helper.make_node("Mod", ["final_add_int32", "const_256"], ["final_mod_int32"], name="mod_fin")
-    nodes.append(mod_fin)
-    cast_fin = helper.make_node("Cast", ["final_mod_int32"], ["output"], to=onnx.TensorProto.UINT8, name="cast_fin")
+    cast_fin = helper.make_node("Cast", ["final_add_int32"], ["output"], to=onnx.TensorProto.UINT8, name="cast_fin")
     nodes.append(cast_fin)
     
-    # Define the output tensor: uint8 [1, OUTPUT_SIZE]
-    output_tensor = helper.make_tensor_value_info("output", onnx.TensorProto.UINT8, [1, OUTPUT_SIZE])
+    # Define the output tensor: uint8 [batch, OUTPUT_SIZE]
+    output_tensor = helper.make_tensor_value_info("output", onnx.TensorProto.UINT8, ["batch", OUTPUT_SIZE])
     
     graph = helper.make_graph(
         nodes=nodes,
@@ -211,7 +200,7 @@ def main(seed_hex, num_rounds):
     print("\nModel Structure:")
     print("Inputs:")
     for inp in model.graph.input:
-        dims = [d.dim_value for d in inp.type.tensor_type.shape.dim]
+        dims = [d.dim_param or d.dim_value for d in inp.type.tensor_type.shape.dim]
         print(f"  {inp.name}: {dims}")
     print("Nodes:")
     for i, node in enumerate(model.graph.node):
@@ -220,7 +209,7 @@ def main(seed_hex, num_rounds):
         print(f"    Outputs: {node.output}")
     print("Outputs:")
     for out in model.graph.output:
-        dims = [d.dim_value for d in out.type.tensor_type.shape.dim]
+        dims = [d.dim_param or d.dim_value for d in out.type.tensor_type.shape.dim]
         print(f"  {out.name}: {dims}")
     
     onnx.save(model, "tens_hash_int8.onnx")
@@ -38,3 +38,14 @@ void compute_binary_and_noise_batch(const uint8_t *inputs, float *binary_out, fl
         );
     }
 }
+
+void compute_sha256_batch(const uint8_t *inputs, uint8_t *digests_out, int batch_size) {
+    #pragma omp parallel for
+    for (int b = 0; b < batch_size; b++) {
+        crypto_hash_sha256(
+            digests_out + (b * crypto_hash_sha256_BYTES),
+            inputs + (b * INPUT_SIZE),
+            INPUT_SIZE
+        );
+    }
+}
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 import argparse
+import ctypes
 import time
 from typing import List, Tuple
 import numpy as np
-from Crypto.Cipher import ChaCha20
+from numba import njit, prange
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
 import torch
 import torch.nn as nn
 
@@ -14,34 +16,119 @@ NUM_HIDDEN_LAYERS = 64
 BATCH_SIZE = 2048     # Batch size for inference
 NUM_NONZERO = 128
 
+# Byte -> trit lookup (byte % 4: 0 -> 0, 1 -> 0, 2 -> 1, 3 -> -1)
+TRIT_LUT = np.array([0, 0, 1, -1] * 64, dtype=np.int8)
+KEYSTREAM_TILE = 16384  # Bytes of keystream generated per step of generate_dense_matrix
+
+@njit(parallel=True, cache=True)
+def fill_nonce_bits(out, start_nonce, one):
+    """Write the bits of nonces start_nonce.. as 0/1 into out (a uint16 view, shape (bits, batch)).
+
+    one is the raw bit pattern of 1.0 in the 16-bit float format out holds (FP16 or BF16).
+    Row k holds bit k of the 32-byte big-endian nonce (MSB first), so only the last 64 rows can be set.
+    """
+    n_bits, batch = out.shape
+    for k in prange(n_bits):
+        shift = n_bits - 1 - k
+        for b in range(batch):
+            if shift < 64 and ((start_nonce + b) >> shift) & 1:
+                out[k, b] = one
+            else:
+                out[k, b] = 0
+
+def pack_ternary(matrix):
+    """Split a {-1, 0, 1} matrix into bit-packed (pos, neg) masks along K plus row sums."""
+    m = matrix.cpu().to(torch.int8).numpy()
+    pos = m == 1
+    neg = m == -1
+    row_sum = pos.sum(axis=1, dtype=np.int32) - neg.sum(axis=1, dtype=np.int32)
+    return np.packbits(pos, axis=1), np.packbits(neg, axis=1), row_sum
+
+class TernaryKernel:
+    """ctypes wrapper around libternary.so (popcount-based ternary layers on packed bits)."""
+    def __init__(self, path="./libternary.so"):
+        self.lib = ctypes.CDLL(path)
+        u8 = np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS")
+        i32 = np.ctypeslib.ndpointer(dtype=np.int32, flags="C_CONTIGUOUS")
+        self.lib.ternary_layer_batch.argtypes = [
+            u8, u8, i32, u8, u8,
+            ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int
+        ]
+        self.lib.ternary_layer_batch.restype = None
+
+    def layer(self, packed, x_bits, residual, out=None):
+        pos, neg, row_sum = packed
+        batch, k_bytes = x_bits.shape
+        if out is None:
+            out = np.empty((batch, pos.shape[0] // 8), dtype=np.uint8)
+        self.lib.ternary_layer_batch(pos, neg, row_sum, x_bits, out,
+                                     pos.shape[0], k_bytes, batch, int(residual))
+        return out
+
 class HashNetwork(nn.Module):
     def __init__(self, matrices):
         super().__init__()
-        self.expansion = matrices[0][1]  # Already a tensor in FP16
-        self.hidden_layers = [matrices[i+1][1] for i in range(NUM_HIDDEN_LAYERS)]
-        self.compression = matrices[-1][1]  # Already a tensor in FP16
-
-    def to(self, device):
-        self.expansion = self.expansion.to(device)
-        self.hidden_layers = [layer.to(device) for layer in self.hidden_layers]
-        self.compression = self.compression.to(device)
+        # Registered as (frozen) parameters so nn.Module.to and torch.compile can see them
+        self.expansion = nn.Parameter(matrices[0][1], requires_grad=False)  # Already a tensor in FP16
+        self.hidden_layers = nn.ParameterList(
+            [nn.Parameter(matrices[i+1][1], requires_grad=False) for i in range(NUM_HIDDEN_LAYERS)])
+        self.compression = nn.Parameter(matrices[-1][1], requires_grad=False)  # Already a tensor in FP16
+        self.kernel = None
+        self.hidden_bits = None
+
+    def to(self, device, dtype=None):
+        super().to(device=device, dtype=dtype)
+        if torch.device(device).type == "cpu":
+            # Activations are always exactly 0/1, so on CPU run the bit-packed
+            # ternary path instead of FP16 matmuls when the kernel is built.
+            try:
+                self.kernel = TernaryKernel()
+            except OSError as e:
+                print(f"Bit-packed ternary kernel unavailable ({e}); run `make libternary.so`. "
+                      "Falling back to dense matmuls")
+                self.kernel = None
+                return self
+            self.packed_expansion = pack_ternary(self.expansion)
+            self.packed_hidden = [pack_ternary(layer) for layer in self.hidden_layers]
+            self.packed_compression = pack_ternary(self.compression)
+        else:
+            self.kernel = None
         return self
 
     def forward(self, x):  # x shape: (INPUT_SIZE, BATCH_SIZE)
+        if self.kernel is not None:
+            return self.forward_packed(x)
+
         # First expansion layer
-        x = torch.matmul(self.expansion, (2.0 * x - 1.0))  # Fused operations
-        x = torch.clip(x, 0.0, 1.0)
+        x = torch.matmul(self.expansion, (2.0 * x - 1.0)).clamp_(0.0, 1.0)
         
-        # Hidden layers with residual connections
+        # Hidden layers with residual connections: addmm adds x_mapped in the GEMM epilogue
         for layer in self.hidden_layers:
             x_mapped = 2.0 * x - 1.0
-            x = torch.clip(torch.matmul(layer, x_mapped) + x_mapped, 0.0, 1.0)  # Fused operations
+            x = torch.addmm(x_mapped, layer, x_mapped).clamp_(0.0, 1.0)
         
         # Compression layer
-        x = torch.clip(torch.matmul(self.compression, (2.0 * x - 1.0)), 0.0, 1.0)  # Fused operations
+        x = torch.matmul(self.compression, (2.0 * x - 1.0)).clamp_(0.0, 1.0)
         
         return x
 
+    def forward_packed(self, x):
+        # Pack each sample's bits along K: (BATCH_SIZE, INPUT_SIZE // 8)
+        x_bits = np.ascontiguousarray(np.packbits(x.numpy().T > 0.5, axis=1))
+        batch = x_bits.shape[0]
+        # Hidden activations stay 1 bit per value and ping-pong between two
+        # buffers that are reused across layers and batches
+        if self.hidden_bits is None or self.hidden_bits[0].shape[0] != batch:
+            self.hidden_bits = [np.empty((batch, HIDDEN_SIZE // 8), dtype=np.uint8) for _ in range(2)]
+        src, dst = self.hidden_bits
+        self.kernel.layer(self.packed_expansion, x_bits, residual=False, out=src)
+        for packed in self.packed_hidden:
+            self.kernel.layer(packed, src, residual=True, out=dst)
+            src, dst = dst, src
+        x_bits = self.kernel.layer(self.packed_compression, src, residual=False)
+        bits = np.ascontiguousarray(np.unpackbits(x_bits, axis=1).T)
+        return torch.from_numpy(bits).to(x.dtype)
+
 def hex_to_bytes(hex_str):
     """Convert hex string to bytes."""
     b = bytes.fromhex(hex_str)
@@ -51,19 +138,21 @@ def hex_to_bytes(hex_str):
 
 def generate_dense_matrix(rows, cols, key, nonce_int):
     """Generate a constant matrix using ChaCha20-based RNG."""
+    # 16-byte OpenSSL IV = 64-bit block counter followed by the original 8-byte nonce,
+    # which yields the same keystream as pycryptodome's ChaCha20 with an 8-byte nonce.
     nonce = nonce_int.to_bytes(8, byteorder='big')
-    cipher = ChaCha20.new(key=key, nonce=nonce)
+    cipher = Cipher(algorithms.ChaCha20(key, b'\x00' * 8 + nonce), mode=None).encryptor()
     
+    # Expand the keystream and map it to trits tile by tile so each tile is
+    # consumed while still in cache instead of streaming the whole layer through RAM
     needed = rows * cols
-    random_bytes = cipher.encrypt(b'\x00' * needed)
-    data = np.frombuffer(random_bytes, dtype=np.uint8)
-    
-    mods = data % 4
-    mapping = np.empty_like(mods, dtype=np.int8)
-    mapping[mods == 0] = 0
-    mapping[mods == 1] = 0
-    mapping[mods == 2] = 1
-    mapping[mods == 3] = -1
+    mapping = np.empty(needed, dtype=np.int8)
+    zeros = bytes(KEYSTREAM_TILE)
+    tile = np.empty(KEYSTREAM_TILE, dtype=np.uint8)
+    for start in range(0, needed, KEYSTREAM_TILE):
+        n = min(KEYSTREAM_TILE, needed - start)
+        cipher.update_into(zeros[:n], tile)
+        np.take(TRIT_LUT, tile[:n], out=mapping[start:start + n])
     
     # Create tensor directly in FP16
     return torch.from_numpy(mapping.reshape((rows, cols))).half()
@@ -98,19 +187,33 @@ class ProofOfWorkMiner:
     def __init__(self, model: HashNetwork, target_difficulty: int):
         self.target_difficulty = target_difficulty
         
-        # Use MPS (Metal) if available
+        # Use MPS (Metal) if available. Ternary weights and 0/1 activations are exact
+        # in any 16-bit float, so pick the fastest one per device: BF16 on Ampere and
+        # newer CUDA GPUs, FP16 on MPS (no BF16 matmul) and older GPUs. On CPU the
+        # model runs the bit-packed ternary kernel if libternary.so is built, and
+        # FP16 only carries input bits.
         if torch.backends.mps.is_available():
             print("Using MPS (Metal) device with half precision")
             self.device = torch.device("mps")
+            self.dtype = torch.float16
         elif torch.cuda.is_available():
-            print("Using CUDA device with half precision")
             self.device = torch.device("cuda")
+            if torch.cuda.get_device_capability(self.device)[0] >= 8:
+                print("Using CUDA device with bfloat16 precision")
+                self.dtype = torch.bfloat16
+                # BF16 holds integers exactly only up to 256; keep FP32 accumulation so
+                # the sign of every pre-clip sum (all that matters) stays exact.
+                torch.backends.cuda.matmul.allow_bf16_reduced_precision_reduction = False
+            else:
+                print("Using CUDA device with half precision")
+                self.dtype = torch.float16
         else:
             print("Using CPU device")
             self.device = torch.device("cpu")
+            self.dtype = torch.float16
             
-        # Move model to device and convert to half precision
-        self.model = model.to(self.device)
+        # Move model to device and convert to the selected precision
+        self.model = model.to(self.device, self.dtype)
         self.model.eval()
         
         # Initialize tracking variables
@@ -119,27 +222,48 @@ class ProofOfWorkMiner:
         self.start_time = time.time()
         self.best_difficulty = 0
         
-        # Pre-allocate arrays for batch processing
-        self.nonce_bytes = np.zeros((BATCH_SIZE, 32), dtype=np.uint8)
+        # Pre-allocate arrays for batch processing. Input bits are built directly in
+        # a (pinned on CUDA) host buffer of the model dtype and uploaded with a single copy.
+        self.host_bits = torch.empty((INPUT_SIZE, BATCH_SIZE), dtype=self.dtype,
+                                     pin_memory=self.device.type == "cuda")
+        self.host_bits_raw = self.host_bits.view(torch.int16).numpy().view(np.uint16)
+        self.one_bits = np.uint16(torch.ones(1, dtype=self.dtype).view(torch.int16).item() & 0xFFFF)
         self.binary_input = torch.zeros((INPUT_SIZE, BATCH_SIZE), 
-                                      dtype=torch.float16, 
+                                      dtype=self.dtype, 
                                       device=self.device)
 
-    def prepare_batch(self) -> None:
-        # Generate sequential nonces
-        nonces = np.arange(self.nonce, self.nonce + BATCH_SIZE, dtype=np.uint64)
-        for i in range(8):
-            self.nonce_bytes[:, 24 + i] = (nonces >> (8 * (7 - i))) & 0xFF
-            
-        # Convert to binary
-        bits = np.unpackbits(self.nonce_bytes, axis=1)[:, :INPUT_SIZE].T.astype(np.float32)
-        self.binary_input.copy_(torch.from_numpy(bits).half())
+        # Fuse the elementwise ops around each GEMM. Inductor is not available
+        # on MPS, so trace there instead; the CPU packed path stays eager.
+        self.graph = None
+        if self.device.type == "cuda":
+            self.forward = torch.compile(self.model, fullgraph=True)
+            self.capture_graph()
+        elif self.device.type == "mps":
+            with torch.no_grad():
+                self.forward = torch.jit.trace(self.model, self.binary_input)
+        else:
+            self.forward = self.model
 
-    def count_leading_zeros(self, output: torch.Tensor) -> int:
-        """Count leading zeros in binary output."""
-        binary = (output.cpu() > 0.5).numpy()
-        nonzero_indices = np.nonzero(binary)[0]
-        return nonzero_indices[0] if len(nonzero_indices) > 0 else INPUT_SIZE
+    @torch.no_grad()
+    def capture_graph(self) -> None:
+        """Capture the fixed-shape CUDA forward pass once so each batch is a single graph replay."""
+        # Warm up (compilation, cuBLAS workspaces) on a side stream before capturing
+        side_stream = torch.cuda.Stream()
+        side_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side_stream):
+            for _ in range(3):
+                self.forward(self.binary_input)
+        torch.cuda.current_stream().wait_stream(side_stream)
+
+        # binary_input and binary_output are the graph's static buffers
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph):
+            self.binary_output = self.forward(self.binary_input)
+
+    def prepare_batch(self) -> None:
+        # Sequential nonces, one per column, as bits in the model dtype
+        fill_nonce_bits(self.host_bits_raw, self.nonce, self.one_bits)
+        self.binary_input.copy_(self.host_bits, non_blocking=True)
 
     def print_status(self):
         """Print current mining status."""
@@ -149,18 +273,24 @@ class ProofOfWorkMiner:
         print(f"Nonce: {self.nonce} | Hashrate: {hashrate:.2f} H/s | "
               f"TOPS: {tops:.2f} | Best difficulty: {self.best_difficulty}")
 
-    def check_solution(self, binary_output: torch.Tensor, batch_index: int) -> bool:
-        """Check if a solution meets the target difficulty."""
-        column = binary_output[:, batch_index]
-        zeros = self.count_leading_zeros(column)
+    def check_solution(self, binary_output: torch.Tensor) -> bool:
+        """Check if any sample in the batch meets the target difficulty."""
+        # Leading zeros per sample (column), reduced to the batch maximum on device
+        bits = (binary_output > 0.5).to(torch.int32)
+        first_one = torch.argmax(bits, dim=0)  # 0 for all-zero columns
+        lz = torch.where(bits.any(dim=0), first_one, torch.full_like(first_one, INPUT_SIZE))
+        best_lz, best_i = torch.max(lz, dim=0)
+        # Only the best count and its index come back to the host
+        zeros, batch_index = torch.stack([best_lz, best_i]).tolist()
         self.best_difficulty = max(self.best_difficulty, zeros)
         
         if zeros >= self.target_difficulty:
+            column = binary_output[:, batch_index]
             solution_nonce = self.nonce + batch_index
             print("\nSolution found!")
             print(f"Nonce: {solution_nonce}")
             print(f"Leading zeros: {zeros}")
-            print(f"Solution input (hex): {bytes(self.nonce_bytes[batch_index]).hex()}")
+            print(f"Solution input (hex): {solution_nonce.to_bytes(32, byteorder='big').hex()}")
             
             # Ensure correct output format
             output_bits = (column.cpu().numpy() > 0.5).astype(np.uint8)
@@ -178,11 +308,14 @@ class ProofOfWorkMiner:
         
         while True:
             self.prepare_batch()
-            binary_output = self.model(self.binary_input)
+            if self.graph is not None:
+                self.graph.replay()
+                binary_output = self.binary_output
+            else:
+                binary_output = self.forward(self.binary_input)
             
-            for i in range(BATCH_SIZE):
-                if self.check_solution(binary_output, i):
-                    return
+            if self.check_solution(binary_output):
+                return
             
             self.nonce += BATCH_SIZE
             self.total_hashes += BATCH_SIZE
@@ -3,11 +3,13 @@ import onnxruntime as ort
 import numpy as np
 import sys
 import time
-import hashlib
+import ctypes
 from typing import Tuple, Optional
+from numba import njit
 
 # Set OPS_PER_HASH as in the C code (operations per hash)
 OPS_PER_HASH = 256 * 256 * 64 + 32 * 256 * 2  # 4,210,688
+BATCH_SIZE = 1024  # Nonces evaluated per session run
 
 # Use the INT8 model file (which now expects UINT8 inputs/outputs)
 MODEL_PATH = "tens_hash_int8.onnx"
@@ -29,37 +31,87 @@ except Exception as e:
         sess_options=session_options
     )
 
-def nonce_to_input(nonce: int) -> np.ndarray:
+# SHA-256 of every input row in one C call (see noise_gen.c)
+libnoise = ctypes.CDLL("./libnoise.so")
+libnoise.compute_sha256_batch.argtypes = [
+    np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS"),
+    np.ctypeslib.ndpointer(dtype=np.uint8, flags="C_CONTIGUOUS"),
+    ctypes.c_int
+]
+libnoise.compute_sha256_batch.restype = None
+
+# Number of leading zero bits in each byte value
+CLZ8 = np.array([8 - b.bit_length() for b in range(256)], dtype=np.uint8)
+
+# I/O buffers reused for every batch (the upper 24 input bytes always stay zero)
+input_buf = np.zeros((BATCH_SIZE, 32), dtype=np.uint8)
+error_buf = np.zeros((BATCH_SIZE, 32), dtype=np.uint8)
+output_buf = np.zeros((BATCH_SIZE, 32), dtype=np.uint8)
+
+# Bind the buffers once so each run reads/writes them in place instead of
+# allocating and copying tensors per call
+input_ov = ort.OrtValue.ortvalue_from_numpy(input_buf)
+error_ov = ort.OrtValue.ortvalue_from_numpy(error_buf)
+output_ov = ort.OrtValue.ortvalue_from_numpy(output_buf)
+binding = session.io_binding()
+binding.bind_ortvalue_input("input", input_ov)
+binding.bind_ortvalue_input("error", error_ov)
+binding.bind_ortvalue_output("output", output_ov)
+
+@njit(cache=True)
+def fill_nonces(buf, start_nonce):
+    """Write nonces start_nonce, start_nonce + 1, ... big-endian into the last 8 bytes of each row."""
+    for r in range(buf.shape[0]):
+        nonce = start_nonce + r
+        for i in range(8):
+            buf[r, 24 + i] = (nonce >> (8 * (7 - i))) & 0xFF
+
+@njit(cache=True)
+def clz256(buf):
+    """Count leading zero bits in a uint8 buffer."""
+    n = 0
+    for b in buf:
+        if b != 0:
+            return n + CLZ8[b]
+        n += 8
+    return n
+
+@njit(cache=True)
+def clz_rows(buf):
+    """Count leading zero bits in each row of a 2D uint8 buffer."""
+    out = np.empty(buf.shape[0], dtype=np.int32)
+    for r in range(buf.shape[0]):
+        out[r] = clz256(buf[r])
+    return out
+
+def nonce_to_input(start_nonce: int) -> np.ndarray:
     """
-    Convert a single nonce to input array format of shape [1, 32] as uint8.
-    The nonce is converted to a 32-byte big-endian representation.
+    Convert BATCH_SIZE consecutive nonces to input array format of shape [BATCH_SIZE, 32] as uint8.
+    Each nonce is written as a 32-byte big-endian representation into input_buf.
     """
-    nonce_bytes = nonce.to_bytes(32, byteorder='big')
-    return np.frombuffer(nonce_bytes, dtype=np.uint8).reshape(1, 32)
+    fill_nonces(input_buf, start_nonce)
+    return input_buf
 
 def compute_error(input_array: np.ndarray) -> np.ndarray:
     """
-    Compute error vector for a single input using SHA-256.
-    Returns a uint8 array with shape [1, 32].
+    Compute error vectors for a batch of inputs using SHA-256 into error_buf.
+    Returns a uint8 array with shape [BATCH_SIZE, 32].
     """
-    input_bytes = input_array.tobytes()  # input_array is already uint8
-    digest = hashlib.sha256(input_bytes).digest()
-    return np.frombuffer(digest[:32], dtype=np.uint8).reshape(1, 32)
+    libnoise.compute_sha256_batch(input_array, error_buf, len(input_array))
+    return error_buf
 
-def run_model_single(nonce: int) -> np.ndarray:
+def run_model_batch(start_nonce: int) -> np.ndarray:
     """
-    Run the ONNX model on a single nonce.
-    Returns the model output as a uint8 array.
+    Run the ONNX model on BATCH_SIZE consecutive nonces starting at start_nonce.
+    Returns the model outputs as a uint8 array of shape [BATCH_SIZE, 32].
     """
-    input_array = nonce_to_input(nonce)
-    error = compute_error(input_array)
-    output = session.run(None, {"input": input_array, "error": error})[0]
-    return output  # output is uint8
+    compute_error(nonce_to_input(start_nonce))
+    session.run_with_iobinding(binding)
+    return output_buf  # output is uint8
 
 def count_leading_zero_bits(arr: bytes) -> int:
     """Count leading zero bits in a byte array."""
-    bits = ''.join(bin(byte)[2:].rjust(8, '0') for byte in arr)
-    return len(bits) - len(bits.lstrip('0'))
+    return int(clz256(np.frombuffer(arr, dtype=np.uint8)))
 
 def search_pow(target_bits: int, max_nonce: Optional[int] = None) -> Tuple[int, bytes]:
     """Search for a nonce that produces the required number of leading zero bits."""
@@ -79,20 +131,24 @@ def search_pow(target_bits: int, max_nonce: Optional[int] = None) -> Tuple[int,
         if max_nonce and nonce >= max_nonce:
             raise ValueError(f"Failed to find solution with {target_bits} leading zero bits after {nonce} attempts")
 
-        output = run_model_single(nonce)
-        output_bytes = output.tobytes()  # already uint8
-        bits = count_leading_zero_bits(output_bytes)
-        best_bits = max(best_bits, bits)
-        hashes += 1
-
-        if bits >= target_bits:
+        output = run_model_batch(nonce)
+        # Ignore rows past max_nonce in the last batch
+        count = min(BATCH_SIZE, max_nonce - nonce) if max_nonce else BATCH_SIZE
+        zeros = clz_rows(output)[:count]
+        best_bits = max(best_bits, int(zeros.max()))
+        hashes += count
+
+        hits = np.flatnonzero(zeros >= target_bits)
+        if hits.size:
+            # Lowest nonce in the batch that meets the target
+            index = int(hits[0])
             elapsed = time.time() - start_time
             avg_hash_rate = hashes / elapsed
             avg_tops = (avg_hash_rate * OPS_PER_HASH) / 1e12
             print()  # New line after progress updates
-            return nonce, output_bytes
+            return nonce + index, output[index].tobytes()  # already uint8
 
-        nonce += 1
+        nonce += count
 
         now = time.time()
         if now - last_report >= 1.0:
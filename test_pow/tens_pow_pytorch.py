@@ -5,6 +5,7 @@ import ctypes
 import numpy as np
 import time
 import threading
+from numba import njit, prange
 from Crypto.Cipher import ChaCha20
 
 # Constants
@@ -72,27 +73,80 @@ class HashVectorGenerator:
 def hex_to_bytes(hex_str):
     return bytes.fromhex(hex_str)
 
-def generate_ternary_matrix_from_seed(seed, device):
+def generate_ternary_matrix_from_seed(seed, device, single_stream=False):
     input_size, output_size = 256, 256
-    A = torch.zeros((input_size, output_size), dtype=torch.float32, device=device)
     pos_count = neg_count = 32
+    nonzero = pos_count + neg_count
+    words_per_row = output_size + nonzero
 
-    for i in range(input_size):
-        nonce = i.to_bytes(8, 'big')
-        cipher = ChaCha20.new(key=seed, nonce=nonce)
-        
-        rand_bytes = cipher.encrypt(b'\x00' * (output_size * 4))
-        rand_ints = np.frombuffer(rand_bytes, dtype=np.int32)
-        chosen_indices = np.argsort(rand_ints)[:64]
-        
-        rand_bytes_shuffle = cipher.encrypt(b'\x00' * (64 * 4))
-        shuffle_ints = np.frombuffer(rand_bytes_shuffle, dtype=np.int32)
-        shuffle_perm = np.argsort(shuffle_ints)
-        sign_vector = torch.tensor([1] * pos_count + [-1] * neg_count, dtype=torch.float32, device=device)
-        sign_vector = sign_vector[torch.tensor(shuffle_perm, dtype=torch.long, device=device)]
-        
-        A[i, torch.tensor(chosen_indices, dtype=torch.long, device=device)] = sign_vector
-    return A
+    # Each row consumes output_size int32 words for index selection followed by
+    # 64 words for the sign shuffle. By default every row gets its own nonce;
+    # single_stream draws all rows from one keystream (not bit-exact).
+    if single_stream:
+        cipher = ChaCha20.new(key=seed, nonce=b'\x00' * 8)
+        rand_bytes = cipher.encrypt(b'\x00' * (input_size * words_per_row * 4))
+    else:
+        rand_bytes = b''.join(
+            ChaCha20.new(key=seed, nonce=i.to_bytes(8, 'big')).encrypt(b'\x00' * (words_per_row * 4))
+            for i in range(input_size))
+    buf = np.frombuffer(rand_bytes, dtype=np.int32).reshape(input_size, words_per_row)
+    rand_ints = buf[:, :output_size]
+    shuffle_ints = buf[:, output_size:]
+
+    # Partition out the 64 smallest, then order just those to match argsort()[:64]
+    chosen_indices = np.argpartition(rand_ints, nonzero, axis=1)[:, :nonzero]
+    order = np.argsort(np.take_along_axis(rand_ints, chosen_indices, axis=1), axis=1)
+    chosen_indices = np.take_along_axis(chosen_indices, order, axis=1)
+
+    sign_vector = np.array([1] * pos_count + [-1] * neg_count, dtype=np.float32)
+    sign_rows = sign_vector[np.argsort(shuffle_ints, axis=1)]
+
+    A = np.zeros((input_size, output_size), dtype=np.float32)
+    np.put_along_axis(A, chosen_indices, sign_rows, axis=1)
+    return torch.from_numpy(A).to(device)
+
+@njit(parallel=True, cache=True)
+def fisher_yates_rows(rand_u32, out, pos_count, neg_count):
+    """
+    Fill each row of out with pos_count +1s and neg_count -1s using partial Fisher-Yates.
+    Row i consumes nonzero words of rand_u32[i] to pick the columns, then nonzero more to shuffle the signs.
+    """
+    rows, cols = out.shape
+    nonzero = pos_count + neg_count
+    for i in prange(rows):
+        columns = np.arange(cols)
+        for k in range(nonzero):
+            j = k + np.int64(rand_u32[i, k]) % (cols - k)
+            columns[k], columns[j] = columns[j], columns[k]
+
+        signs = np.empty(nonzero, dtype=np.float32)
+        signs[:pos_count] = 1.0
+        signs[pos_count:] = -1.0
+        for k in range(nonzero):
+            j = k + np.int64(rand_u32[i, nonzero + k]) % (nonzero - k)
+            signs[k], signs[j] = signs[j], signs[k]
+
+        for k in range(nonzero):
+            out[i, columns[k]] = signs[k]
+
+def generate_ternary_matrix_fisher_yates(seed, device):
+    """
+    O(N) alternative to generate_ternary_matrix_from_seed: same row structure (32 +1s,
+    32 -1s), but sampled with Fisher-Yates from one keystream, so the matrix differs.
+    """
+    input_size, output_size = 256, 256
+    pos_count = neg_count = 32
+    words_per_row = 2 * (pos_count + neg_count)
+
+    cipher = ChaCha20.new(key=seed, nonce=b'\x00' * 8)
+    rand_bytes = cipher.encrypt(b'\x00' * (input_size * words_per_row * 4))
+    rand_u32 = np.frombuffer(rand_bytes, dtype=np.uint32).reshape(input_size, words_per_row)
+
+    A = np.zeros((input_size, output_size), dtype=np.float32)
+    fisher_yates_rows(rand_u32, A, pos_count, neg_count)
+    if not (np.all((A == 1).sum(axis=1) == pos_count) and np.all((A == -1).sum(axis=1) == neg_count)):
+        raise RuntimeError(f"Fisher-Yates matrix rows must have {pos_count} +1s and {neg_count} -1s")
+    return torch.from_numpy(A).to(device)
 
 def apply_matrix_rounds(binary_vectors, ternary_matrix, bias_plus_noise):
     # Process all inputs in parallel through all rounds
@@ -174,12 +228,18 @@ def find_pow(ternary_matrix, target_bytes, batch_size=BATCH_SIZE, device='mps'):
         sys.exit(0)
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: tens_pow_pytorch.py <32-byte-hex-seed> <32-byte-hex-target>")
+    # --single-stream draws the whole matrix from one keystream and --fisher-yates
+    # samples it with Fisher-Yates instead of argsort (faster, neither is bit-exact)
+    flags = {"--single-stream", "--fisher-yates"}
+    single_stream = "--single-stream" in sys.argv[1:]
+    fisher_yates = "--fisher-yates" in sys.argv[1:]
+    args = [a for a in sys.argv[1:] if a not in flags]
+    if len(args) != 2 or (single_stream and fisher_yates):
+        print("Usage: tens_pow_pytorch.py [--single-stream | --fisher-yates] <32-byte-hex-seed> <32-byte-hex-target>")
         sys.exit(1)
         
-    seed = hex_to_bytes(sys.argv[1])
-    target_bytes = hex_to_bytes(sys.argv[2])
+    seed = hex_to_bytes(args[0])
+    target_bytes = hex_to_bytes(args[1])
     
     if len(seed) != 32 or len(target_bytes) != 32:
         print("Error: Both seed and target must be 32 bytes (64 hex chars)")
@@ -191,7 +251,10 @@ def main():
     print(f"Target: {target_bytes.hex()}")
     print(f"Batch size: {BATCH_SIZE}")
     
-    ternary_matrix = generate_ternary_matrix_from_seed(seed, device)
+    if fisher_yates:
+        ternary_matrix = generate_ternary_matrix_fisher_yates(seed, device)
+    else:
+        ternary_matrix = generate_ternary_matrix_from_seed(seed, device, single_stream=single_stream)
     solution = find_pow(ternary_matrix, target_bytes)
     print(f"Solution: {solution}")
 
@@ -0,0 +1,52 @@
+#include <stdint.h>
+#include <string.h>
+
+// One ternary layer on bit-packed activations:
+//   y[r] = clip(W[r] . (2x - 1) (+ (2x[r] - 1) if residual), 0, 1)
+// W is stored as two bitmasks (pos, neg) packed along K, so for binary x
+//   W[r] . (2x - 1) = 2 * (popcount(pos & x) - popcount(neg & x)) - row_sum[r]
+// and the layer needs no multiplies at all.
+//
+// pos, neg: rows x k_bytes, x: batch x k_bytes, out: batch x rows/8.
+// Bits are packed MSB first within each byte (np.packbits order) and
+// k_bytes must be a multiple of 8.
+
+static inline uint64_t load64(const uint8_t *p) {
+    uint64_t v;
+    memcpy(&v, p, sizeof(v));
+    return v;
+}
+
+void ternary_layer_batch(const uint8_t *pos, const uint8_t *neg, const int32_t *row_sum,
+                         const uint8_t *x, uint8_t *out,
+                         int rows, int k_bytes, int batch, int residual) {
+    const int out_bytes = rows / 8;
+
+    #pragma omp parallel for
+    for (int b = 0; b < batch; b++) {
+        const uint8_t *xb = x + (size_t)b * k_bytes;
+        uint8_t *ob = out + (size_t)b * out_bytes;
+
+        for (int o = 0; o < out_bytes; o++) {
+            // Assemble 8 output bits in a register and store the byte once
+            uint8_t byte = 0;
+            for (int bit = 0; bit < 8; bit++) {
+                const int r = o * 8 + bit;
+                const uint8_t *pr = pos + (size_t)r * k_bytes;
+                const uint8_t *nr = neg + (size_t)r * k_bytes;
+                int acc = 0;
+                for (int k = 0; k < k_bytes; k += 8) {
+                    uint64_t xv = load64(xb + k);
+                    acc += __builtin_popcountll(load64(pr + k) & xv);
+                    acc -= __builtin_popcountll(load64(nr + k) & xv);
+                }
+                int y = 2 * acc - row_sum[r];
+                if (residual) {
+                    y += 2 * ((xb[o] >> (7 - bit)) & 1) - 1;
+                }
+                byte = (uint8_t)((byte << 1) | (y > 0));
+            }
+            ob[o] = byte;
+        }
+    }
+}